@@ -0,0 +1,92 @@
+/*
+ * AVX2 version of the blend from create_image.py (the JS .scan() math).
+ *
+ * The math runs in fixed point at twice the JS scale, so every term is an integer:
+ *   b1 = r / 2, b2 = g / 2 + 127.5, a = 255 - b2 + b1  ->  2a = 255 + r - g
+ * which makes b = b1 / a = r / 2a. The division is replaced by a lookup in a
+ * 16.16 reciprocal table of 2a, and recip[0] = 0 gives the JS result b = 0
+ * for a == 0 without any branch or blend.
+ *
+ * Built into the blend_kernel extension by setup.py. Without AVX2 (e.g. on ARM)
+ * only the scalar loop is compiled.
+ */
+#include "blend_avx2.h"
+
+#ifdef __AVX2__
+#include <immintrin.h>
+const int blend_avx2_enabled = 1;
+#else
+const int blend_avx2_enabled = 0;
+#endif
+
+/* 2a is always within 0..510 */
+#define A2_MAX 510
+
+static int32_t recip[A2_MAX + 1];
+
+void blend_avx2_init(void)
+{
+    recip[0] = 0;
+    for (int a2 = 1; a2 <= A2_MAX; a2++)
+        recip[a2] = (65536 + a2 / 2) / a2;
+}
+
+static inline void blend_pixel(uint8_t r, uint8_t g, uint8_t *out,
+                               const int32_t bc1[3], const int32_t delta[3])
+{
+    int32_t a2 = 255 + r - g;
+    /* b in 16.16 fixed point */
+    int32_t t = r * recip[a2];
+
+    for (int c = 0; c < 3; c++)
+        out[c] = (uint8_t)(bc1[c] + ((delta[c] * t + 0x8000) >> 16));
+    out[3] = (uint8_t)((a2 + 1) >> 1);
+}
+
+#ifdef __AVX2__
+/* bc1 + round(delta * b), for 8 pixels at once */
+#define INTERPOLATE(bc, d, t) \
+    _mm256_add_epi32((bc), _mm256_srai_epi32(_mm256_add_epi32(_mm256_mullo_epi32((d), (t)), half), 16))
+#endif
+
+void blend_avx2(const uint8_t *r, const uint8_t *g, uint8_t *out_rgba, size_t n,
+                const int32_t bc1[3], const int32_t delta[3])
+{
+    size_t i = 0;
+
+#ifdef __AVX2__
+    const __m256i c255 = _mm256_set1_epi32(255);
+    const __m256i one = _mm256_set1_epi32(1);
+    const __m256i half = _mm256_set1_epi32(0x8000);
+    const __m256i bc1r = _mm256_set1_epi32(bc1[0]);
+    const __m256i bc1g = _mm256_set1_epi32(bc1[1]);
+    const __m256i bc1b = _mm256_set1_epi32(bc1[2]);
+    const __m256i dr = _mm256_set1_epi32(delta[0]);
+    const __m256i dg = _mm256_set1_epi32(delta[1]);
+    const __m256i db = _mm256_set1_epi32(delta[2]);
+
+    /* 8 pixels per iteration: 8 bytes each of r and g in, 32 bytes of RGBA out */
+    for (; i + 8 <= n; i += 8) {
+        __m256i rv = _mm256_cvtepu8_epi32(_mm_loadl_epi64((const __m128i *)(r + i)));
+        __m256i gv = _mm256_cvtepu8_epi32(_mm_loadl_epi64((const __m128i *)(g + i)));
+
+        __m256i a2 = _mm256_sub_epi32(_mm256_add_epi32(rv, c255), gv);
+        __m256i t = _mm256_mullo_epi32(rv, _mm256_i32gather_epi32((const int *)recip, a2, 4));
+
+        __m256i red = INTERPOLATE(bc1r, dr, t);
+        __m256i green = INTERPOLATE(bc1g, dg, t);
+        __m256i blue = INTERPOLATE(bc1b, db, t);
+        __m256i alpha = _mm256_srli_epi32(_mm256_add_epi32(a2, one), 1);
+
+        /* Every channel is within 0..255, so the pixel packs into one 32-bit lane */
+        __m256i px = _mm256_or_si256(
+            _mm256_or_si256(red, _mm256_slli_epi32(green, 8)),
+            _mm256_or_si256(_mm256_slli_epi32(blue, 16), _mm256_slli_epi32(alpha, 24)));
+        _mm256_storeu_si256((__m256i *)(out_rgba + 4 * i), px);
+    }
+#endif
+
+    /* Remaining pixels (or all of them without AVX2) */
+    for (; i < n; i++)
+        blend_pixel(r[i], g[i], out_rgba + 4 * i, bc1, delta);
+}
@@ -0,0 +1,20 @@
+#ifndef BLEND_AVX2_H
+#define BLEND_AVX2_H
+
+#include <stddef.h>
+#include <stdint.h>
+
+/* 1 when blend_avx2() was compiled with AVX2 intrinsics, 0 for the scalar fallback. */
+extern const int blend_avx2_enabled;
+
+/* Fills the reciprocal table used by blend_avx2(); call once before blending. */
+void blend_avx2_init(void);
+
+/*
+ * Blends n pixels of r (image1) and g (image2) into n RGBA pixels of out_rgba.
+ * bc1 is background color 1 and delta is (bc2 - bc1), per RGB channel.
+ */
+void blend_avx2(const uint8_t *r, const uint8_t *g, uint8_t *out_rgba, size_t n,
+                const int32_t bc1[3], const int32_t delta[3]);
+
+#endif
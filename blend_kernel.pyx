@@ -0,0 +1,76 @@
+# cython: language_level=3
+"""
+Compiled version of the blend from create_image.py (the JS .scan() math).
+Build it next to create_image.py with:
+
+    python setup.py build_ext --inplace
+
+create_image.py picks it up automatically when the build succeeded.
+"""
+cimport cython
+from libc.math cimport lrintf
+from libc.stdint cimport int32_t, uint8_t
+
+cdef extern from "blend_avx2.h":
+    const int blend_avx2_enabled
+    void blend_avx2_init()
+    void c_blend_avx2 "blend_avx2"(const uint8_t *r, const uint8_t *g, uint8_t *out_rgba, size_t n,
+                                   const int32_t *bc1, const int32_t *delta) nogil
+
+blend_avx2_init()
+
+# True when blend_avx2 runs the AVX2 intrinsics rather than its scalar fallback
+HAS_AVX2 = bool(blend_avx2_enabled)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cpdef void blend(const unsigned char[:, :] r, const unsigned char[:, :] g, unsigned char[:, :, :] out,
+                 int bc1r, int bc1g, int bc1b, int dr, int dg, int db) noexcept:
+    """
+    Writes the RGBA result of blending r (image1) and g (image2) into out.
+    (bc1r, bc1g, bc1b) is background color 1 and (dr, dg, db) is (bc2 - bc1).
+    """
+    cdef Py_ssize_t height = r.shape[0]
+    cdef Py_ssize_t width = r.shape[1]
+    cdef Py_ssize_t y, x
+    cdef float b1, b2, a, b
+
+    with nogil:
+        for y in range(height):
+            for x in range(width):
+                b1 = r[y, x] * 0.5
+                b2 = g[y, x] * 0.5 + 127.5
+
+                a = 255.0 - b2 + b1
+
+                # Avoid division by zero
+                b = b1 / a if a > 0 else 0.0
+
+                out[y, x, 0] = <unsigned char>lrintf(bc1r + dr * b)
+                out[y, x, 1] = <unsigned char>lrintf(bc1g + dg * b)
+                out[y, x, 2] = <unsigned char>lrintf(bc1b + db * b)
+                # a is always within 0..255, so it needs no clamping
+                out[y, x, 3] = <unsigned char>lrintf(a)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cpdef blend_avx2(const unsigned char[:, :] r, const unsigned char[:, :] g, unsigned char[:, :, :] out,
+                 int bc1r, int bc1g, int bc1b, int dr, int dg, int db):
+    """
+    Same as blend(), but in fixed point using the AVX2 kernel from blend_avx2.c, one row at a time.
+    Rows may be strided, but the pixels within a row must be contiguous.
+    """
+    if r.strides[1] != 1 or g.strides[1] != 1 or out.strides[1] != 4 or out.strides[2] != 1:
+        raise ValueError("blend_avx2 needs contiguous pixels within each row")
+
+    cdef Py_ssize_t y
+    cdef int32_t bc1[3]
+    cdef int32_t delta[3]
+    bc1[0], bc1[1], bc1[2] = bc1r, bc1g, bc1b
+    delta[0], delta[1], delta[2] = dr, dg, db
+
+    with nogil:
+        for y in range(r.shape[0]):
+            c_blend_avx2(&r[y, 0], &g[y, 0], &out[y, 0, 0], r.shape[1], bc1, delta)
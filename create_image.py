@@ -1,6 +1,52 @@
+import os
 import sys
+import glob
 import argparse
-from PIL import Image, ImageColor, ImageChops
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import PIL
+from PIL import Image, ImageColor
+
+try:
+    # Optional: compiled blend kernel, built with 'python setup.py build_ext --inplace'
+    import blend_kernel
+except ImportError:
+    blend_kernel = None
+
+try:
+    # Optional: JIT-compiles the blend kernel into a single parallel pass
+    import numba
+except ImportError:
+    numba = None
+
+try:
+    # Optional: runs the NumPy blend on a CUDA GPU with --device cuda
+    import cupy
+except ImportError:
+    cupy = None
+
+# Pillow-SIMD is a drop-in Pillow fork with much faster resizing; its
+# version strings carry a '.postN' suffix (e.g. "9.5.0.post1").
+PILLOW_SIMD = 'post' in PIL.__version__
+
+# ITU-R 601-2 luma weights, the same ones Pillow's convert('L') uses
+LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+# 16.16 fixed-point reciprocals of 2a (0..510), which turn the blend's b1 / a
+# division into a lookup. The entry for 0 is 0, giving the JS result b = 0 there.
+RECIP_A2 = np.array([0] + [(65536 + a2 // 2) // a2 for a2 in range(1, 511)], dtype=np.int32)
+
+# Edge length of the tiles the NumPy blend works on. The int32 working arrays
+# for one tile (5 x 4 bytes per pixel, ~1.3 MB) then fit a typical L2 cache.
+TILE_SIZE = 256
+
+# Resampling filters selectable with --resample
+RESAMPLE_FILTERS = {
+    'nearest': Image.Resampling.NEAREST,
+    'bilinear': Image.Resampling.BILINEAR,
+    'bicubic': Image.Resampling.BICUBIC,
+    'lanczos': Image.Resampling.LANCZOS,
+}
 
 def hex_to_rgb(hex_str):
     """
@@ -9,26 +55,15 @@ def hex_to_rgb(hex_str):
     """
     try:
         # ImageColor.getrgb handles both "#FFF" and "#FFFFFF" formats
-        return ImageColor.getrgb(hex_str)
+        # Drop any alpha component from "#RRGGBBAA" style strings
+        return ImageColor.getrgb(hex_str)[:3]
     except ValueError:
         print(f"Error: Invalid color string '{hex_str}'. Please use #RRGGBB or #RGB format.")
         sys.exit(1)
 
-def interpolate(x, bc1, bc2):
-    """
-    Linearly interpolates between two background colors (bc1, bc2) by a factor of x (0.0 to 1.0).
-    This is a direct Python translation of the 'interpolate' function from the JS code.
-    """
-    # bc1 and bc2 are already (r, g, b) tuples
-    r = bc1[0] + (bc2[0] - bc1[0]) * x
-    g = bc1[1] + (bc2[1] - bc1[1]) * x
-    b = bc1[2] + (bc2[2] - bc1[2]) * x
-    # Return a tuple of rounded integers
-    return (int(round(r)), int(round(g)), int(round(b)))
-
-def load_and_prepare_image(image_path, size):
+def load_and_prepare_image(image_path, size, resample=Image.Resampling.BICUBIC):
     """
-    Loads an image, handles transparency, converts it to grayscale, and resizes it proportionally.
+    Loads an image, resizes it proportionally, then handles transparency and converts it to grayscale.
     This replaces the core logic of the 'loadImage' function from the JS code.
     """
     try:
@@ -40,136 +75,306 @@ def load_and_prepare_image(image_path, size):
         print(f"Error opening image '{image_path}': {e}")
         sys.exit(1)
 
-    # 1. Create a white background to handle transparency in the input image.
-    #    This corresponds to the JS .composite(..., BLEND_DESTINATION_OVER) and .opaque()
-    bg = Image.new("RGB", img.size, (255, 255, 255))
-    try:
-        # Paste using the alpha channel as a mask
-        bg.paste(img, (0, 0), img)
-    except ValueError:
-        # If the image has no alpha channel, paste it directly
-        bg.paste(img, (0, 0))
-    
-    img = bg
+    # 1. Resize proportionally (corresponds to JS .resize(..., Jimp.RESIZE_BICUBIC))
+    #    This happens first, so the transparency and grayscale work below only
+    #    touches the small image rather than the full source resolution.
+    #    For JPEGs, draft() makes the decoder skip the detail the resize would throw
+    #    away (decoding at down to 1/8 scale, but at least 2x 'size') and return
+    #    grayscale directly. It does nothing for other formats.
+    img.draft('L', (size * 2, size * 2))
+    #    Palette (and other) images cannot be resized smoothly, so convert those first.
+    if img.mode not in ('L', 'LA', 'RGB', 'RGBA'):
+        img = img.convert('RGBA')
+    #    Image.thumbnail maintains the aspect ratio, limiting the longest edge to 'size'.
+    #    BICUBIC matches the JS original and is much cheaper than LANCZOS.
+    img.thumbnail((size, size), resample)
 
-    # 2. Convert to grayscale (corresponds to JS .greyscale())
-    img = img.convert('L')
+    # 2. Composite onto a white background to handle transparency in the input image,
+    #    and convert to grayscale in the same pass.
+    #    This corresponds to the JS .composite(..., BLEND_DESTINATION_OVER), .opaque()
+    #    and .greyscale()
+    #    Images without an alpha channel get a fully opaque one from convert('RGBA').
+    rgba = np.asarray(img.convert('RGBA'), dtype=np.float32)
+    alpha = rgba[..., 3:4] * (1 / 255.0)
+    gray = (rgba[..., :3] * alpha + 255.0 * (1 - alpha)) @ LUMA_WEIGHTS
 
-    # 3. Resize proportionally (corresponds to JS .resize(..., Jimp.RESIZE_BICUBIC))
-    #    Image.thumbnail maintains the aspect ratio, limiting the longest edge to 'size'.
-    #    LANCZOS is a high-quality filter, similar to BICUBIC.
-    img.thumbnail((size, size), Image.Resampling.LANCZOS)
+    # Round and clamp in place, so float32 error can never wrap around in the uint8 cast
+    np.rint(gray, out=gray)
+    np.clip(gray, 0, 255, out=gray)
+    img = Image.fromarray(gray.astype(np.uint8), 'L')
 
     return img
 
+def make_blend_scratch(height, width, xp=np):
+    """
+    Allocates the int32 working arrays blend_arrays needs for up to height x width pixels.
+    """
+    return (xp.empty((height, width), dtype=np.int32),
+            xp.empty((height, width), dtype=np.int32),
+            xp.empty((height, width, 3), dtype=np.int32))
+
+def blend_arrays(r_val, g_val, bc1_arr, delta, out=None, scratch=None):
+    """
+    Applies the JS .scan() math to whole grayscale arrays using NumPy integer math.
+    r_val comes from image1 and g_val from image2; bc1_arr is background color 1
+    and delta is (bc2 - bc1), both as int32 RGB vectors.
+    Writes into (and returns) 'out', an RGBA uint8 array allocated if not given.
+    'scratch' (from make_blend_scratch) lets repeated calls reuse the working arrays.
+    Also runs unchanged on CuPy arrays, in which case everything stays on the GPU.
+    """
+    # numpy or cupy, depending on where the input arrays live
+    xp = cupy.get_array_module(r_val) if cupy is not None else np
+    bc1_arr = xp.asarray(bc1_arr)
+    delta = xp.asarray(delta)
+
+    height, width = r_val.shape
+    if out is None:
+        out = xp.empty((height, width, 4), dtype=np.uint8)
+    if scratch is None:
+        scratch = make_blend_scratch(height, width, xp)
+    a2, b, rgb = (buf[:height, :width] for buf in scratch)
+
+    # --- This is the core of the JS algorithm ---
+    #    Working at twice the JS scale keeps every term an exact integer:
+    #    b1 = r / 2, b2 = g / 2 + 127.5, a = 255 - b2 + b1  ->  2a = 255 + r - g
+    #    Every step writes into the scratch arrays instead of new temporaries.
+    xp.add(r_val, 255, out=a2, dtype=np.int32)
+    xp.subtract(a2, g_val, out=a2) # 2 * a, always within 0..510
+
+    # Calculate final RGB via interpolation between the background colors:
+    #    bc1 + delta * (b1 / a), where b1 / a = r / 2a comes from a table lookup
+    #    in 16.16 fixed point instead of a division. (Same math as blend_avx2.c.)
+    xp.take(xp.asarray(RECIP_A2), a2, out=b)
+    xp.multiply(b, r_val, out=b)
+    xp.multiply(b[..., None], delta, out=rgb)
+    rgb += 0x8000
+    rgb >>= 16
+    rgb += bc1_arr
+
+    # Round alpha; it is already within the 0-255 range
+    a2 += 1
+    a2 >>= 1
+
+    # Write the final RGBA pixels straight into their channel slots
+    out[..., :3] = rgb
+    out[..., 3] = a2
+    # --- End of algorithm ---
+
+    return out
+
+def blend_arrays_threaded(r_val, g_val, bc1_arr, delta, out):
+    """
+    Runs blend_arrays over TILE_SIZE x TILE_SIZE tiles of the image in a thread pool, writing into 'out'.
+    Each tile's working arrays stay in the CPU cache, and NumPy releases the GIL inside
+    its array operations, so the tiles run concurrently.
+    """
+    height, width = r_val.shape
+    tiles = [(y, x) for y in range(0, height, TILE_SIZE) for x in range(0, width, TILE_SIZE)]
+    workers = max(1, min(os.cpu_count() or 1, len(tiles)))
+
+    def blend_tiles(chunk):
+        # One set of scratch arrays per worker, reused for all of its tiles
+        scratch = make_blend_scratch(TILE_SIZE, TILE_SIZE)
+        for y, x in chunk:
+            tile = (slice(y, y + TILE_SIZE), slice(x, x + TILE_SIZE))
+            r_tile = r_val[tile]
+            g_tile = g_val[tile]
+            if not r_tile.any() and (g_tile == 255).all():
+                # Only the black/white backgrounds here: fully transparent bc1
+                out[tile + (slice(0, 3),)] = bc1_arr
+                out[tile + (3,)] = 0
+            else:
+                blend_arrays(r_tile, g_tile, bc1_arr, delta, out[tile], scratch)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # list() surfaces any exception raised inside a worker
+        list(executor.map(blend_tiles, [tiles[i::workers] for i in range(workers)]))
+
+    return out
+
+if numba is not None:
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _blend_kernel(r, g, bc1r, bc1g, bc1b, dr, dg, db, out):
+        """
+        Fused version of the JS .scan() math, compiled with Numba.
+        Writes each RGBA pixel of 'out' once, with rows processed in parallel.
+        (dr, dg, db) is the precomputed (bc2 - bc1) color difference.
+        """
+        height, width = r.shape
+        for y in numba.prange(height):
+            for x in range(width):
+                b1 = r[y, x] * 0.5
+                b2 = g[y, x] * 0.5 + 127.5
+
+                a = 255.0 - b2 + b1
+
+                # The a > 0 guard keeps NaNs out, so fastmath is safe here
+                b = b1 / a if a > 0 else 0.0
+
+                out[y, x, 0] = np.rint(bc1r + dr * b)
+                out[y, x, 1] = np.rint(bc1g + dg * b)
+                out[y, x, 2] = np.rint(bc1b + db * b)
+                out[y, x, 3] = min(255.0, max(0.0, np.rint(a)))
+else:
+    _blend_kernel = None
+
+class Compositor:
+    """
+    Runs the core compositing algorithm for a fixed --size and pair of background colors.
+    The canvas buffers are allocated once and reused for every image pair, so batch
+    runs do not pay for fresh allocations on each call.
+    """
+
+    def __init__(self, size, bc1, bc2, device='cpu'):
+        self.device = device
+
+        # The interpolation only ever needs bc1 and (bc2 - bc1), so compute them once
+        self.bc1_arr = np.array(bc1, dtype=np.int32)
+        self.delta = np.array(bc2, dtype=np.int32) - self.bc1_arr
+
+        # Prepared images never exceed size x size, so these cover any canvas
+        self._base1 = np.empty((size, size), dtype=np.uint8)
+        self._base2 = np.empty((size, size), dtype=np.uint8)
+        self._rgba = np.empty((size, size, 4), dtype=np.uint8)
+
+    def _blend(self, r_val, g_val, rgba):
+        """
+        Runs the JS .scan() math with the fastest available backend, writing into rgba.
+        """
+        if self.device == 'cuda':
+            print("Executing core algorithm (cuda)...")
+            rgba[...] = blend_arrays(cupy.asarray(r_val), cupy.asarray(g_val), self.bc1_arr, self.delta).get()
+        elif blend_kernel is not None and blend_kernel.HAS_AVX2:
+            print("Executing core algorithm (compiled, AVX2)...")
+            blend_kernel.blend_avx2(r_val, g_val, rgba, *self.bc1_arr, *self.delta)
+        elif blend_kernel is not None:
+            print("Executing core algorithm (compiled)...")
+            blend_kernel.blend(r_val, g_val, rgba, *self.bc1_arr, *self.delta)
+        elif _blend_kernel is not None:
+            print("Executing core algorithm (numba)...")
+            _blend_kernel(r_val, g_val, *self.bc1_arr, *self.delta, rgba)
+        else:
+            print("Executing core algorithm (vectorized)...")
+            blend_arrays_threaded(r_val, g_val, self.bc1_arr, self.delta, rgba)
+
+    def composite(self, img1, img2):
+        """
+        Executes the core image compositing algorithm on two prepared grayscale images.
+        This replaces the 'composite' function from the JS code.
+        Returns a new RGBA image, including its 1px transparent border.
+        """
+        # 3. Determine final canvas size (JS: resultWidth, resultHeight)
+        result_width = max(img1.width, img2.width)
+        result_height = max(img1.height, img2.height)
+        print(f"Creating canvas with size: {result_width}x{result_height}")
+
+        # 4. Paste images centered onto black/white backgrounds
+        #    (JS: new Jimp(..., "#000000") / "#FFFFFF")
+        #    The backgrounds are views into the reusable buffers.
+        base1 = self._base1[:result_height, :result_width]
+        base2 = self._base2[:result_height, :result_width]
+        base1.fill(0)   # Black
+        base2.fill(255) # White
+
+        offset1 = (int(round((result_width - img1.width) / 2)), int(round((result_height - img1.height) / 2)))
+        offset2 = (int(round((result_width - img2.width) / 2)), int(round((result_height - img2.height) / 2)))
+
+        base1[offset1[1]:offset1[1] + img1.height, offset1[0]:offset1[0] + img1.width] = np.asarray(img1)
+        base2[offset2[1]:offset2[1] + img2.height, offset2[0]:offset2[0] + img2.width] = np.asarray(img2)
+
+        # base1 (image1) and base2 (image2) now hold the grayscale images at the final size
+
+        # 5. Simulate the JS channel blend
+        #    JS: image1(G=-255) + image2(R=-255)
+        #    Result: R = image1, G = image2
+        #    The R and G channels never exist as a separate image: the blend reads
+        #    the two grayscale canvases and writes straight into the RGBA buffer.
+        r_val = base1 # from image1
+        g_val = base2 # from image2
+
+        # 6. Apply the JS .scan() math to every pixel at once
+        rgba = self._rgba[:result_height, :result_width]
+        if np.array_equal(r_val, g_val):
+            # Both sides are identical, so each output pixel only depends on its gray level:
+            # blend the 256 possible levels once and look the whole canvas up in that table.
+            print("Identical inputs, using a lookup table...")
+            levels = np.arange(256, dtype=np.uint8)[None, :]
+            lut = np.empty((1, 256, 4), dtype=np.uint8)
+            self._blend(levels, levels, lut)
+            rgba[...] = lut[0][r_val]
+        else:
+            self._blend(r_val, g_val, rgba)
+
+        print("Algorithm complete.")
+
+        # 7. *** Add 1px transparent border ***
+        #    Padding with zeros gives (0, 0, 0, 0) = R,G,B,Alpha (fully transparent),
+        #    and leaves the original pixels at offset (1, 1).
+        print("Adding 1px transparent border...")
+        bordered = np.pad(rgba, ((1, 1), (1, 1), (0, 0)), mode='constant')
+        bordered_image = Image.fromarray(bordered, 'RGBA')
+
+        return bordered_image
+
+def find_batch_pairs(pattern1, pattern2, output):
+    """
+    Expands the two --batch glob patterns and pairs their matches in sorted order.
+    Output names are numbered after the --output name, e.g. result_1.png, result_2.png.
+    """
+    files1 = sorted(glob.glob(pattern1))
+    files2 = sorted(glob.glob(pattern2))
+    if not files1 or len(files1) != len(files2):
+        print(f"Error: Batch patterns matched {len(files1)} and {len(files2)} files; they must match the same non-zero number.")
+        sys.exit(1)
+
+    stem, ext = os.path.splitext(output)
+    return [(f1, f2, f"{stem}_{i}{ext}") for i, (f1, f2) in enumerate(zip(files1, files2), start=1)]
+
 def composite_images(args):
     """
-    Executes the core image compositing algorithm.
-    This replaces the 'composite' function from the JS code.
+    Loads the input image pair(s), runs the compositing algorithm and saves the result(s).
     """
     print("Starting image processing...")
+    if not PILLOW_SIMD:
+        print("Tip: 'pip install pillow-simd' for faster image resizing.")
 
-    # 1. Load and prepare images
-    print(f"Loading image 1: {args.image1}")
-    img1 = load_and_prepare_image(args.image1, args.size)
-    print(f"Loading image 2: {args.image2}")
-    img2 = load_and_prepare_image(args.image2, args.size)
-
-    # 2. Convert background colors
+    # 1. Convert background colors
     bc1 = hex_to_rgb(args.color1)
     bc2 = hex_to_rgb(args.color2)
     print(f"Background color 1: {bc1}")
     print(f"Background color 2: {bc2}")
 
-    # 3. Determine final canvas size (JS: resultWidth, resultHeight)
-    result_width = max(img1.width, img2.width)
-    result_height = max(img1.height, img2.height)
-    print(f"Creating canvas with size: {result_width}x{result_height}")
+    if args.device == 'cuda' and cupy is None:
+        print("Error: --device cuda requires CuPy. Install it with 'pip install cupy-cuda12x' (matching your CUDA version).")
+        sys.exit(1)
 
-    # 4. Paste images centered onto black/white backgrounds
-    #    (JS: new Jimp(..., "#000000") / "#FFFFFF")
-    base1 = Image.new('L', (result_width, result_height), 0)   # Black
-    base2 = Image.new('L', (result_width, result_height), 255) # White
+    if args.batch:
+        jobs = find_batch_pairs(args.image1, args.image2, args.output)
+        print(f"Batch mode: {len(jobs)} image pairs")
+    else:
+        jobs = [(args.image1, args.image2, args.output)]
 
-    offset1 = (int(round((result_width - img1.width) / 2)), int(round((result_height - img1.height) / 2)))
-    offset2 = (int(round((result_width - img2.width) / 2)), int(round((result_height - img2.height) / 2)))
+    # One compositor for the whole run, so its buffers are reused across pairs
+    compositor = Compositor(args.size, bc1, bc2, args.device)
+    resample = RESAMPLE_FILTERS[args.resample]
 
-    base1.paste(img1, offset1)
-    base2.paste(img2, offset2)
-    
-    # base1 (image1) and base2 (image2) are now grayscale images at the final size
-    
-    # 5. Simulate the JS channel blend
-    #    JS: image1(G=-255) + image2(R=-255)
-    #    Result: R = image1, G = image2
-    #    We merge the two grayscale images directly into the R and G channels.
-    print("Merging image channels...")
-    # We only need R and G. The B channel can be ignored (set to 0).
-    blue_channel = Image.new('L', (result_width, result_height), 0)
-    merged_rg = Image.merge('RGB', (base1, base2, blue_channel))
-    
-    # 6. Prepare the output image and pixel access
-    result_image = Image.new('RGBA', (result_width, result_height))
-    
-    # Load pixel data for fast read/write access
-    try:
-        merged_pixels = merged_rg.load()
-        result_pixels = result_image.load()
-    except Exception as e:
-        print(f"Error accessing pixel data: {e}")
-        return
+    for image1, image2, output in jobs:
+        # 2. Load and prepare images
+        print(f"Loading image 1: {image1}")
+        img1 = load_and_prepare_image(image1, args.size, resample)
+        print(f"Loading image 2: {image2}")
+        img2 = load_and_prepare_image(image2, args.size, resample)
 
-    print("Executing core algorithm (pixel scan)...")
-    
-    # 7. Iterate over all pixels (JS: .scan() function)
-    for y in range(result_height):
-        for x in range(result_width):
-            # r_val is from image1, g_val is from image2
-            r_val, g_val, _ = merged_pixels[x, y]
-            
-            # --- This is the core of the JS algorithm ---
-            b1 = float(r_val) / 2.0
-            b2 = float(g_val) / 2.0 + 127.5
-            
-            a = 255.0 - b2 + b1
-            
-            b = 0.0
-            if a > 0:
-                # Avoid division by zero
-                b = b1 / a
-            
-            # Calculate final RGB via interpolation
-            rgb_tuple = interpolate(b, bc1, bc2)
-            
-            # Round alpha and clamp it to the 0-255 range
-            final_alpha = int(round(a))
-            final_alpha = max(0, min(255, final_alpha)) # Clamp
-            
-            # Set the final RGBA pixel
-            result_pixels[x, y] = (rgb_tuple[0], rgb_tuple[1], rgb_tuple[2], final_alpha)
-            # --- End of algorithm ---
-
-    print("Algorithm complete.")
-
-    # 7b. *** Add 1px transparent border ***
-    print("Adding 1px transparent border...")
-    new_width = result_image.width + 2
-    new_height = result_image.height + 2
-    
-    # Create a canvas that is (0, 0, 0, 0) = R,G,B,Alpha (fully transparent)
-    bordered_image = Image.new('RGBA', (new_width, new_height), (0, 0, 0, 0))
-    
-    # Paste the original image into the center of the new canvas (at offset 1, 1)
-    bordered_image.paste(result_image, (1, 1))
-    
-    # 8. Save the final image
-    print("Saving file...")
-    try:
-        # Save the image with the border
-        bordered_image.save(args.output)
-        print(f"\nSuccess! Image saved to: {args.output}")
-    except Exception as e:
-        print(f"Error saving image: {e}")
+        bordered_image = compositor.composite(img1, img2)
+
+        # 8. Save the final image
+        print("Saving file...")
+        try:
+            # Save the image with the border; low zlib levels are much faster to write
+            bordered_image.save(output, compress_level=args.compress_level, optimize=False)
+            print(f"\nSuccess! Image saved to: {output}")
+        except Exception as e:
+            print(f"Error saving image: {e}")
 
 def main():
     """
@@ -212,6 +417,33 @@ def main():
         default=320,
         help="The maximum size (pixels) for the longest edge of the image.\n(default: 320)"
     )
+    parser.add_argument(
+        "-r", "--resample",
+        choices=sorted(RESAMPLE_FILTERS),
+        default="bicubic",
+        help="The resampling filter used when resizing the input images.\n(default: bicubic)"
+    )
+    parser.add_argument(
+        "--compress-level",
+        type=int,
+        choices=range(10),
+        default=1,
+        metavar="{0-9}",
+        help="The PNG zlib compression level: 0 is fastest, 9 is smallest.\n(default: 1)"
+    )
+    parser.add_argument(
+        "-d", "--device",
+        choices=["cpu", "cuda"],
+        default="cpu",
+        help="Where to run the blend; 'cuda' needs CuPy and an NVIDIA GPU.\n(default: cpu)"
+    )
+    parser.add_argument(
+        "-b", "--batch",
+        action="store_true",
+        help="Treat image1 and image2 as glob patterns (quote them) and process\n"
+             "their sorted matches pairwise, saving numbered outputs\n"
+             "(e.g. result_1.png, result_2.png)."
+    )
     
     args = parser.parse_args()
     